@@ -7,14 +7,17 @@ manages the user database, and performs daily access checks.
 
 import asyncio
 import importlib
-from datetime import datetime, timedelta
-from aiogram import Bot, Dispatcher, types  # type: ignore
-from aiogram.filters import Command  # type: ignore
-from aiogram.exceptions import TelegramAPIError  # type: ignore
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from typing import Any, Awaitable, Callable, Optional
+from aiogram import Bot, Dispatcher, F, types  # type: ignore
+from aiogram.filters import Command, Filter  # type: ignore
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter  # type: ignore
 from apscheduler.schedulers.asyncio import AsyncIOScheduler  # type: ignore
 from apscheduler.triggers.cron import CronTrigger  # type: ignore
 from gc_client import GetCourseClient  # type: ignore
 from database import Database  # type: ignore
+from rate_limiter import AsyncTokenBucket  # type: ignore
 from logger import logger  # type: ignore
 import config  # type: ignore
 
@@ -26,6 +29,93 @@ email_futures = {}
 db = Database()
 scheduler = AsyncIOScheduler(timezone="Asia/Almaty")  # Global scheduler
 CHECK_ALL_CHATS_JOB_ID = "1"
+TELEGRAM_MAX_RETRIES = 3
+# Bans shorter than 30 seconds are treated by Telegram as permanent,
+# the margin covers clock skew between the bot and Telegram servers
+KICK_BAN_SECONDS = 90
+# Telegram limits: about 30 requests per second overall and 20 per minute per group
+global_bucket = AsyncTokenBucket(rate=25, per=1.0)
+chat_buckets = defaultdict(lambda: AsyncTokenBucket(rate=20, per=60.0))
+chat_to_group = {}  # chat_id -> (group_name, set of GetCourse group IDs)
+send_time_of_day = time()  # Parsed config.SEND_TIME
+
+def build_chat_to_group() -> None:
+    """Rebuilds the chat_to_group index from config.CHAT_IDS_GROUPS."""
+    global chat_to_group  # pylint: disable=global-statement
+    index = {}
+    for group_name, group_data in config.CHAT_IDS_GROUPS.items():
+        allowed_groups = {str(group_id) for group_id in group_data["gc_group_ids"]}
+        for chat_id in group_data["chat_ids"]:
+            # The first group listing a chat wins
+            if chat_id in index:
+                logger.warning(
+                    "Chat %s listed in groups %s and %s, using %s",
+                    chat_id, index[chat_id][0], group_name, index[chat_id][0]
+                )
+                continue
+            index[chat_id] = (group_name, allowed_groups)
+    chat_to_group = index
+    logger.debug("Chat index built for %s chats", len(chat_to_group))
+
+def parse_send_time() -> None:
+    """Parses config.SEND_TIME into send_time_of_day."""
+    global send_time_of_day  # pylint: disable=global-statement
+    send_time_of_day = datetime.strptime(config.SEND_TIME, "%H:%M").time()
+    logger.debug("Send time parsed: %s", send_time_of_day)
+
+async def rate_limited(chat_id: Optional[int], method: Callable[..., Awaitable[Any]],
+                       *args: Any, **kwargs: Any) -> Any:
+    """
+    Calls a Bot API method respecting Telegram rate limits.
+
+    On TelegramRetryAfter the limiters are paused for the requested time
+    and the call is repeated.
+
+    Args:
+        chat_id: Group chat ID to apply the per-chat limit to, None for private messages.
+        method: Bot API method, e.g. bot.send_message.
+        *args: Positional arguments of the method.
+        **kwargs: Keyword arguments of the method.
+
+    Returns:
+        Result of the method.
+    """
+    for retry in range(TELEGRAM_MAX_RETRIES + 1):
+        await global_bucket.acquire()
+        if chat_id is not None:
+            await chat_buckets[chat_id].acquire()
+        try:
+            return await method(*args, **kwargs)
+        except TelegramRetryAfter as e:
+            if retry == TELEGRAM_MAX_RETRIES:
+                raise
+            logger.warning("Telegram flood control, retrying in %s seconds", e.retry_after)
+            global_bucket.pause(e.retry_after)
+            if chat_id is not None:
+                chat_buckets[chat_id].pause(e.retry_after)
+
+class HasPendingEmail(Filter):  # pylint: disable=too-few-public-methods
+    """Passes only messages from users the bot is waiting for an email from."""
+
+    async def __call__(self, message: types.Message) -> bool:
+        return message.from_user is not None and message.from_user.id in email_futures
+
+async def kick_chat_member(chat_id: int, user_id: int) -> bool:
+    """
+    Removes a user from a chat with a temporary ban that lifts itself.
+
+    until_date is calculated at call time, so a call delayed by the rate limiter
+    or repeated after TelegramRetryAfter does not turn into a permanent ban.
+
+    Args:
+        chat_id: Chat ID.
+        user_id: User ID.
+
+    Returns:
+        bool: Result of ban_chat_member.
+    """
+    until_date = int(datetime.now().timestamp()) + KICK_BAN_SECONDS
+    return await bot.ban_chat_member(chat_id, user_id, until_date=until_date)
 
 @dp.message(Command("update_config"))
 async def update_config(message: types.Message) -> None:
@@ -46,6 +136,8 @@ async def update_config(message: types.Message) -> None:
         logger.debug("Configuration reloaded")
         gc_client.reload_config()
         logger.debug("gc_client configuration updated")
+        build_chat_to_group()
+        parse_send_time()
         
         # Remove old task check_all_chats
         scheduler.remove_job(CHECK_ALL_CHATS_JOB_ID)
@@ -82,7 +174,8 @@ async def handle_join_request(request: types.ChatJoinRequest) -> None:
     logger.info("Join request from %s (%s) to chat %s", user.full_name, user.id, chat_id)
 
     try:
-        await bot.send_message(user.id, config.MESSAGES["hello"], parse_mode="Markdown")
+        await rate_limited(None, bot.send_message, user.id, config.MESSAGES["hello"],
+                           parse_mode="Markdown")
         logger.info("Sent welcome message to user %s", user.id)
     except TelegramAPIError as e:
         logger.warning("Failed to send welcome message to user %s: %s", user.id, e)
@@ -93,8 +186,9 @@ async def handle_join_request(request: types.ChatJoinRequest) -> None:
         logger.info("Received email %s from user %s (attempt %s)", email, user.id, attempt + 1)
 
         if await db.is_duplicate(email):
-            await bot.decline_chat_join_request(chat_id, user.id)
-            await bot.send_message(user.id, config.MESSAGES["is_duplicate"], parse_mode="Markdown")
+            await rate_limited(chat_id, bot.decline_chat_join_request, chat_id, user.id)
+            await rate_limited(None, bot.send_message, user.id, config.MESSAGES["is_duplicate"],
+                               parse_mode="Markdown")
             logger.info("Email %s already registered, request declined", email)
             return
 
@@ -102,24 +196,26 @@ async def handle_join_request(request: types.ChatJoinRequest) -> None:
             return
 
         if attempt == 0:
-            await bot.send_message(user.id, config.MESSAGES["try2"], parse_mode="Markdown")
+            await rate_limited(None, bot.send_message, user.id, config.MESSAGES["try2"],
+                               parse_mode="Markdown")
             logger.info("Requested another email attempt for %s", user.id)
 
-    await bot.decline_chat_join_request(chat_id, user.id)
-    await bot.send_message(user.id, config.MESSAGES["is_not_access"], parse_mode="Markdown")
+    await rate_limited(chat_id, bot.decline_chat_join_request, chat_id, user.id)
+    await rate_limited(None, bot.send_message, user.id, config.MESSAGES["is_not_access"],
+                       parse_mode="Markdown")
     logger.info("Request %s declined after two failed attempts", user.id)
 
-@dp.message()
+@dp.message(F.chat.type == "private", F.text, HasPendingEmail())
 async def catch_email(message: types.Message) -> None:
     """
-    Handles incoming messages with emails from users.
+    Handles incoming private messages with emails from users awaiting verification.
 
     Args:
         message: Incoming message.
     """
     user_id = message.from_user.id
     if user_id in email_futures and not email_futures[user_id].done():
-        email = message.text.strip()
+        email = message.text.strip().lower()
         email_futures[user_id].set_result(email)
         logger.info("Received email %s from user %s", email, user_id)
 
@@ -170,23 +266,21 @@ async def check_and_add_user(chat_id: int, user_id: int, email: str) -> bool:
         return False
 
     # Searching for a group with current chat_id
-    allowed_groups = []
-    for group_name, group_data in config.CHAT_IDS_GROUPS.items():
-        if chat_id in group_data["chat_ids"]:
-            allowed_groups = group_data["gc_group_ids"]
-            logger.debug(
-                "Found group %s for chat %s with GetCourse groups: %s"
-                group_name, chat_id, allowed_groups
-            )
-            break
-    else:
+    entry = chat_to_group.get(chat_id)
+    if entry is None:
         logger.debug("Chat %s not found in CHAT_IDS_GROUPS", chat_id)
         return False
+    group_name, allowed_groups = entry
+    logger.debug(
+        "Found group %s for chat %s with GetCourse groups: %s",
+        group_name, chat_id, allowed_groups
+    )
 
-    if any(str(group_id) in group_ids for group_id in allowed_groups):
+    if not allowed_groups.isdisjoint(group_ids):
         try:
-            await bot.approve_chat_join_request(chat_id, user_id)
-            await bot.send_message(user_id, config.MESSAGES["is_access"], parse_mode="Markdown")
+            await rate_limited(chat_id, bot.approve_chat_join_request, chat_id, user_id)
+            await rate_limited(None, bot.send_message, user_id, config.MESSAGES["is_access"],
+                               parse_mode="Markdown")
             await db.add(user_id, email, chat_id)
             logger.info("User %s (%s) approved in chat %s", user_id, email, chat_id)
             return True
@@ -198,21 +292,24 @@ async def send_delayed_message(user_id: int, message: str, send_time: float) ->
     """
     Sends a scheduled message to a user and removes it from the database.
 
+    The message is removed even if sending fails, so that a user who blocked the bot
+    does not hold up the rest of the queue.
+
     Args:
         user_id: User ID.
         message: Message Text.
         send_time: Time of message sending (timestamp).
     """
     try:
-        await bot.send_message(user_id, message, parse_mode="Markdown")
+        await rate_limited(None, bot.send_message, user_id, message, parse_mode="Markdown")
         logger.info(
             "Sent scheduled message to user %s about access expiration", 
             user_id
             )
-        await db.remove_scheduled_message(user_id, send_time)
-        logger.debug("Removed task for user %s from database", user_id)
     except TelegramAPIError as e:
         logger.warning("Failed to send scheduled message to user %s: %s", user_id, e)
+    await db.remove_scheduled_message(user_id, send_time)
+    logger.debug("Removed task for user %s from database", user_id)
 
 async def check_all_chats() -> None:
     """
@@ -224,91 +321,136 @@ async def check_all_chats() -> None:
     starting at config.SEND_TIME the same day.
     """
     logger.info("Starting daily access check")
+    # Initial send time
+    base_send_time = datetime.combine(datetime.now().date(), send_time_of_day)
+    offset_seconds = 0
+
     for group_name, group_data in config.CHAT_IDS_GROUPS.items():
         chat_ids = group_data["chat_ids"]
         group_ids = group_data["gc_group_ids"]
         logger.info("Checking group %s with chats %s", group_name, chat_ids)
 
         try:
-            emails = []
-            for group_id in group_ids:
-                try:
-                    group_emails = await gc_client.get_group_emails(int(group_id))
-                    emails.extend(group_emails)
-                    logger.debug("Received emails for group %s: %s", group_id, len(group_emails))
-                except Exception as e:  # pylint: disable=broad-exception-caught
-                    logger.warning("Error retrieving emails for group %s: %s", group_id, e)
-            emails = list(set(emails))
+            emails: set[str] = set()
+            # Exports of all groups are requested concurrently, so their wait times overlap
+            results = await asyncio.gather(
+                *(gc_client.get_group_emails(int(group_id)) for group_id in group_ids),
+                return_exceptions=True
+            )
+            for group_id, result in zip(group_ids, results):
+                if isinstance(result, Exception):
+                    logger.warning("Error retrieving emails for group %s: %s", group_id, result)
+                    continue
+                emails.update(email.lower().strip() for email in result)
+                logger.debug("Received emails for group %s: %s", group_id, len(result))
             logger.info("Group %s: collected %s unique emails", group_name, len(emails))
         except Exception as e:  # pylint: disable=broad-exception-caught
             logger.error("Error processing group %s: %s", group_name, e)
             continue
 
-        # Initial send time
-        today = datetime.now().date()
-        base_send_time = datetime.combine(today, datetime.strptime(config.SEND_TIME, "%H:%M").time())
-        offset_seconds = 0
-
-        for chat_id in chat_ids:
-            chat_users = await db.get_users_by_chat_id(int(chat_id))
-            logger.info("Chat %s: found %s users in database", chat_id, len(chat_users))
-
-            for user_id_str, email in list(chat_users.items()):
-                user_id = int(user_id_str)
-                if email not in emails:
-                    try:
-                        await bot.ban_chat_member(chat_id, user_id)
-                        await bot.unban_chat_member(chat_id, user_id)
-                        await db.remove(chat_id, user_id)
-                        logger.info(
-                            "User %s (%s) removed from chat %s due to lack of access"
-                            user_id, email, chat_id
-                        )
-                        # Increment send time by 1 second for each user
-                        send_time = base_send_time + timedelta(seconds=offset_seconds)
-                        await db.add_scheduled_message(user_id,
-                                                       config.MESSAGES["is_end_access"],
-                                                       send_time)
-                        logger.debug(
-                            "Saved scheduled message for user %s at %s"
-                            user_id, send_time
-                        )
-                        offset_seconds += 1
-                    except TelegramAPIError as e:
-                        logger.warning(
-                            "Failed to remove user %s from chat %s: %s"
-                            user_id, chat_id, e
-                        )
+        # Only users without access are kept in memory
+        users_without_access = [
+            user async for user in db.iter_users_for_chats([int(chat_id) for chat_id in chat_ids])
+            if user[2].lower().strip() not in emails
+        ]
+        logger.info("Group %s: found %s users without access", group_name, len(users_without_access))
+
+        removals = []
+        scheduled = []
+        for chat_id, user_id, email in users_without_access:
+            try:
+                await rate_limited(chat_id, kick_chat_member, chat_id, user_id)
+                logger.info(
+                    "User %s (%s) removed from chat %s due to lack of access",
+                    user_id, email, chat_id
+                )
+                # Increment send time by 1 second for each user
+                send_time = base_send_time + timedelta(seconds=offset_seconds)
+                removals.append((chat_id, user_id))
+                scheduled.append((user_id, config.MESSAGES["is_end_access"], send_time))
+                offset_seconds += 1
+            except TelegramAPIError as e:
+                logger.warning(
+                    "Failed to remove user %s from chat %s: %s",
+                    user_id, chat_id, e
+                )
+
+        try:
+            await db.bulk_remove_and_schedule(removals, scheduled)
+            logger.debug(
+                "Group %s: removed %s users from database and saved their scheduled messages",
+                group_name, len(removals)
+            )
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.error(
+                "Group %s: failed to save removal of %s users to database: %s",
+                group_name, len(removals), e
+            )
 
 async def process_scheduled_messages() -> None:
     """
     Background task for sending scheduled messages.
 
-    Checks the database every 10 seconds for precise message sending at the specified time.
+    Sleeps until the earliest scheduled message is due and sends all messages due by then.
+    Adding a new scheduled message wakes the task up, so an earlier message is not missed.
+    Messages overdue by more than config.SCHEDULED_MESSAGE_MAX_AGE_HOURS are dropped,
+    so a restart after downtime does not send old notifications at once.
     """
     while True:
-        messages = await db.get_scheduled_messages()
+        db.scheduled_added.clear()
+        next_send_time = await db.get_next_send_time()
+        if next_send_time is None:
+            timeout = 60
+        else:
+            timeout = max(0, next_send_time - datetime.now().timestamp())
+
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(db.scheduled_added.wait(), timeout=timeout)
+                continue  # New message added, recalculate the next send time
+            except asyncio.TimeoutError:
+                pass
+
         current_time = datetime.now().timestamp()
+        max_age_hours = getattr(config, "SCHEDULED_MESSAGE_MAX_AGE_HOURS", 12)
+        stale = await db.remove_stale_scheduled_messages(current_time - max_age_hours * 3600)
+        if stale:
+            logger.warning("Dropped %s scheduled messages overdue by more than %s hours",
+                           stale, max_age_hours)
+
+        messages = await db.get_scheduled_messages(current_time)
         for msg in messages:
-            if abs(current_time - msg["send_time"]) <= 5:  # Margin of 5 seconds
-                await send_delayed_message(msg["user_id"], msg["message"], msg["send_time"])
-        await asyncio.sleep(10)  # Check every 10 seconds
+            await send_delayed_message(msg["user_id"], msg["message"], msg["send_time"])
 
 async def main() -> None:
     """Starts the bot, scheduler, and initializes the database."""
+    build_chat_to_group()
+    parse_send_time()
     await db.initialize()  # Initialization of SQLite database
-    scheduler.add_job(
-        check_all_chats,
-        CronTrigger(hour=config.CHECK_TIME_HOUR, minute=config.CHECK_TIME_MIN, timezone="Asia/Almaty"),
-        id=CHECK_ALL_CHATS_JOB_ID,
-        replace_existing=True
-    )
-    scheduler.start()
-    logger.info(f"Scheduler started, daily check scheduled for {config.CHECK_TIME_HOUR}:{config.CHECK_TIME_MIN}")
-    asyncio.create_task(process_scheduled_messages())
-    logger.info("Background task for sending messages started")
-    await dp.start_polling(bot)
-    logger.info("Bot started and running in polling mode")
+    # The open connection keeps the process alive, so it must be closed on any failure
+    try:
+        await gc_client.start()  # Shared HTTP session for GetCourse API
+        scheduler.add_job(
+            check_all_chats,
+            CronTrigger(hour=config.CHECK_TIME_HOUR, minute=config.CHECK_TIME_MIN, timezone="Asia/Almaty"),
+            id=CHECK_ALL_CHATS_JOB_ID,
+            replace_existing=True
+        )
+        scheduler.start()
+        logger.info(f"Scheduler started, daily check scheduled for {config.CHECK_TIME_HOUR}:{config.CHECK_TIME_MIN}")
+        asyncio.create_task(process_scheduled_messages())
+        logger.info("Background task for sending messages started")
+        await dp.start_polling(bot)
+        logger.info("Bot started and running in polling mode")
+    finally:
+        await gc_client.close()
+        await db.close()
+        logger.info("Database connection closed")
 
 if __name__ == "__main__":
+    try:
+        import uvloop  # type: ignore  # pylint: disable=import-outside-toplevel
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass  # uvloop is optional, fall back to the default event loop
     asyncio.run(main())
@@ -11,8 +11,16 @@ BASE_GC_API = ""
 # API key for GetCourse
 GC_API_KEY = ""
 
-# Setting wait time for GetCourse API
-GC_WAIT_SECONDS = {'groups': 60, 'users': 10}
+# Maximum wait time for GetCourse exports to be ready (in seconds)
+GC_WAIT_SECONDS = {'groups': 600, 'users': 120}
+
+# Maximum delay between export status checks (in seconds)
+GC_EXPORT_POLL_MAX_DELAY = 30
+
+# Timeouts for GetCourse API requests (in seconds)
+# sock_connect: connecting to the server, sock_read: pause between received chunks,
+# total: whole request including download of large exports
+GC_REQUEST_TIMEOUT = {'sock_connect': 30, 'sock_read': 60, 'total': 300}
 
 # Maximum number of retries for API requests
 GC_MAX_RETRIES = 3
@@ -20,6 +28,9 @@ GC_MAX_RETRIES = 3
 # Delay between retries (in seconds)
 GC_RETRY_DELAY = 5
 
+# Time to keep found GetCourse groups of a user in cache (in seconds)
+GC_CACHE_TTL = 300
+
 # Paths in responses from API GetCourse
 FIELDS_PATH = "info.fields"
 ITEMS_PATH = "info.items"
@@ -38,6 +49,10 @@ CHECK_TIME_HOUR = 4
 CHECK_TIME_MIN = 0
 SEND_TIME = "09:00"
 
+# Scheduled messages overdue by more than this number of hours are dropped
+# instead of being sent (e.g. after the bot was down)
+SCHEDULED_MESSAGE_MAX_AGE_HOURS = 12
+
 # Messages to users
 # Used in bot.py for sending responses to users.
 # Keya (e.g., "hello") are used in code, values are message texts to be sent to users.
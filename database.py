@@ -3,10 +3,14 @@ Module for managing the Telegram chat user database.
 Provides the Database class for managing user data in SQLite.
 """
 
+import asyncio
 from datetime import datetime
-from typing import Dict
+from typing import AsyncIterator, List, Optional, Tuple
 import aiosqlite  # type: ignore
 
+# Number of rows fetched at once when iterating over query results
+FETCH_CHUNK_SIZE = 256
+
 class Database:
     """Class for managing the user database in SQLite."""
 
@@ -18,31 +22,57 @@ class Database:
             path (str): Path to database file. Default is 'db.sqlite'.
         """
         self.path = path
+        self._conn: Optional[aiosqlite.Connection] = None
+        # Created in initialize() to bind them to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+        self.scheduled_added: Optional[asyncio.Event] = None
 
     async def initialize(self) -> None:
-        """Initializes the database and creates the users and scheduled_messages tables."""
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    chat_id INTEGER,
-                    user_id INTEGER,
-                    email TEXT,
-                    PRIMARY KEY (chat_id, user_id)
-                )
-            """)
-            await db.execute("""
-                CREATE TABLE IF NOT EXISTS scheduled_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message TEXT,
-                    send_time REAL
-                )
-            """)
-            await db.commit()
+        """
+        Opens the shared connection and creates the users and scheduled_messages tables.
+
+        The connection is kept open for the lifetime of the bot and runs in WAL mode
+        with synchronous=NORMAL, so commits do not fsync the main database file.
+        """
+        self._lock = asyncio.Lock()
+        self.scheduled_added = asyncio.Event()
+        self._conn = await aiosqlite.connect(self.path)
+        await self._conn.execute("PRAGMA journal_mode=WAL")
+        await self._conn.execute("PRAGMA synchronous=NORMAL")
+        await self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                chat_id INTEGER,
+                user_id INTEGER,
+                email TEXT,
+                PRIMARY KEY (chat_id, user_id)
+            )
+        """)
+        await self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS scheduled_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER,
+                message TEXT,
+                send_time REAL
+            )
+        """)
+        await self._conn.execute("DROP INDEX IF EXISTS idx_users_email")
+        await self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_users_email_nocase ON users(email COLLATE NOCASE)"
+        )
+        await self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sched_sendtime ON scheduled_messages(send_time)"
+        )
+        await self._conn.commit()
+
+    async def close(self) -> None:
+        """Closes the shared database connection."""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
 
     async def is_duplicate(self, email: str) -> bool:
         """
-        Checks if an email exists in the database.
+        Checks if an email exists in the database, ignoring case.
 
         Args:
             email (str): Email for checking.
@@ -50,8 +80,8 @@ class Database:
         Returns:
             bool: True, if email exists, otherwise False.
         """
-        async with aiosqlite.connect(self.path) as db:
-            cursor = await db.execute("SELECT 1 FROM users WHERE email = ?", (email,))
+        async with self._lock:
+            cursor = await self._conn.execute("SELECT 1 FROM users WHERE email = ? COLLATE NOCASE", (email,))
             return await cursor.fetchone() is not None
 
     async def add(self, user_id: int, email: str, chat_id: int) -> None:
@@ -63,73 +93,111 @@ class Database:
             email (str): User email.
             chat_id (int): Chat ID.
         """
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
+        async with self._lock:
+            await self._conn.execute(
                 "INSERT INTO users (chat_id, user_id, email) VALUES (?, ?, ?)",
                 (chat_id, user_id, email)
             )
-            await db.commit()
+            await self._conn.commit()
 
-    async def remove(self, chat_id: int, user_id: int) -> None:
+    async def iter_users_for_chats(self, chat_ids: List[int]) -> AsyncIterator[Tuple[int, int, str]]:
         """
-        Removes a user from the database.
+        Yields users of several chats from a single query, fetching rows in chunks.
 
-        Args:
-            chat_id (int): Chat ID.
-            user_id (int): User ID.
-        """
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute("DELETE FROM users WHERE chat_id = ? AND user_id = ?", (chat_id, user_id,))
-            await db.commit()
+        The database lock is held only while a chunk is fetched, so other queries
+        are not blocked while the caller processes rows or stops iterating early.
 
-    async def get_users_by_chat_id(self, chat_id: int) -> Dict[str, str]:
-        """
-        Returns a dictionary of users for a specified chat.
+        Args:
+            chat_ids (list): Chat IDs.
+
+        Yields:
+            tuple: (chat_id, user_id, email) for each user of the specified chats.
+        """
+        if not chat_ids:
+            return
+        placeholders = ", ".join("?" * len(chat_ids))
+        async with self._lock:
+            cursor = await self._conn.execute(
+                f"SELECT chat_id, user_id, email FROM users WHERE chat_id IN ({placeholders})",
+                tuple(chat_ids)
+            )
+        try:
+            while True:
+                async with self._lock:
+                    rows = await cursor.fetchmany(FETCH_CHUNK_SIZE)
+                if not rows:
+                    break
+                for row in rows:
+                    yield tuple(row)
+        finally:
+            await cursor.close()
+
+    async def bulk_remove_and_schedule(
+        self,
+        removals: List[Tuple[int, int]],
+        messages: List[Tuple[int, str, datetime]]
+    ) -> None:
+        """
+        Removes users and adds scheduled messages in a single transaction.
+
+        Wakes up the sending task if any messages were added.
 
         Args:
-            chat_id (int): Char ID.
+            removals (list): List of tuples (chat_id, user_id) to remove.
+            messages (list): List of tuples (user_id, message, send_time) to schedule.
+
+        Raises:
+            aiosqlite.Error: If the batch fails, after rolling it back.
+        """
+        if not removals and not messages:
+            return
+        async with self._lock:
+            try:
+                await self._conn.executemany(
+                    "DELETE FROM users WHERE chat_id = ? AND user_id = ?",
+                    removals
+                )
+                await self._conn.executemany(
+                    "INSERT INTO scheduled_messages (user_id, message, send_time) VALUES (?, ?, ?)",
+                    [(user_id, message, send_time.timestamp()) for user_id, message, send_time in messages]
+                )
+                await self._conn.commit()
+            except Exception:
+                # Do not leave a half-done batch to be committed by the next write
+                await self._conn.rollback()
+                raise
+        if messages:
+            self.scheduled_added.set()
 
-        Returns:
-            dict: Dictionary in the format {user_id: email} for the specified chat or empty dictionary.
+    async def get_next_send_time(self) -> Optional[float]:
         """
-        users = {}
-        async with aiosqlite.connect(self.path) as db:
-            cursor = await db.execute(
-                "SELECT user_id, email FROM users WHERE chat_id = ?",
-                (chat_id,)
-            )
-            rows = await cursor.fetchall()
-            for user_id, email in rows:
-                users[str(user_id)] = email
-        return users
+        Returns the send time of the earliest scheduled message.
 
-    async def add_scheduled_message(self, user_id: int, message: str, send_time: datetime) -> None:
+        Returns:
+            float: Timestamp of the earliest scheduled message or None, if there are none.
         """
-        Adds a scheduled message to the database.
+        async with self._lock:
+            cursor = await self._conn.execute("SELECT MIN(send_time) FROM scheduled_messages")
+            row = await cursor.fetchone()
+        return row[0]
 
-        Args:
-            user_id (int): User ID.
-            message (str): Message text.
-            send_time (datetime): Time of message sending.
+    async def get_scheduled_messages(self, until: float) -> list:
         """
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
-                "INSERT INTO scheduled_messages (user_id, message, send_time) VALUES (?, ?, ?)",
-                (user_id, message, send_time.timestamp())
-            )
-            await db.commit()
+        Returns a list of scheduled messages due by the specified time.
 
-    async def get_scheduled_messages(self) -> list:
-        """
-        Returns a list of all scheduled messages.
+        Args:
+            until (float): Upper bound of send time (timestamp), inclusive.
 
         Returns:
             list: List of dictionaries with fields user_id, message, send_time.
         """
-        async with aiosqlite.connect(self.path) as db:
-            cursor = await db.execute("SELECT user_id, message, send_time FROM scheduled_messages")
+        async with self._lock:
+            cursor = await self._conn.execute(
+                "SELECT user_id, message, send_time FROM scheduled_messages WHERE send_time <= ?",
+                (until,)
+            )
             rows = await cursor.fetchall()
-            return [{"user_id": row[0], "message": row[1], "send_time": row[2]} for row in rows]
+        return [{"user_id": row[0], "message": row[1], "send_time": row[2]} for row in rows]
 
     async def remove_scheduled_message(self, user_id: int, send_time: float) -> None:
         """
@@ -139,9 +207,27 @@ class Database:
             user_id (int): User ID.
             send_time (float): Time of message sending (timestamp).
         """
-        async with aiosqlite.connect(self.path) as db:
-            await db.execute(
+        async with self._lock:
+            await self._conn.execute(
                 "DELETE FROM scheduled_messages WHERE user_id = ? AND send_time = ?",
                 (user_id, send_time)
             )
-            await db.commit()
+            await self._conn.commit()
+
+    async def remove_stale_scheduled_messages(self, before: float) -> int:
+        """
+        Removes scheduled messages with send time earlier than the specified time.
+
+        Args:
+            before (float): Lower bound of send time to keep (timestamp).
+
+        Returns:
+            int: Number of removed messages.
+        """
+        async with self._lock:
+            cursor = await self._conn.execute(
+                "DELETE FROM scheduled_messages WHERE send_time < ?",
+                (before,)
+            )
+            await self._conn.commit()
+        return cursor.rowcount
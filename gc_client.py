@@ -5,17 +5,23 @@ Provides an asynchronous client for retrieving group and user data.
 
 import asyncio
 import importlib
+import time
+from operator import itemgetter
 from urllib.parse import quote
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 import aiohttp  # type: ignore
 import config  # type: ignore
 from logger import logger  # type: ignore
 
+# GetCourse error code for an export whose file is not created yet
+EXPORT_NOT_READY_CODE = 909
+
 class GetCourseClient:
     """Client for interacting with the GetCourse API."""
 
     def __init__(self):
         self.session: Optional[aiohttp.ClientSession] = None
+        self._email_cache: Dict[str, Tuple[float, List[str]]] = {}
         self._load_config()
         self._validate_config()
 
@@ -28,13 +34,19 @@ class GetCourseClient:
             'items': config.ITEMS_PATH,
             'export_id': config.EXPORT_ID_PATH
         }
+        self.api_paths_split = {name: tuple(path.split(".")) for name, path in self.api_paths.items()}
         self.fields = {
             'email': config.FIELD_EMAIL,
             'group_id': config.FIELD_GROUP_ID
         }
-        self.wait_seconds = getattr(config, 'GC_WAIT_SECONDS', {'groups': 60, 'users': 10})
+        self.wait_seconds = getattr(config, 'GC_WAIT_SECONDS', {'groups': 600, 'users': 120})
+        self.export_poll_max_delay = getattr(config, 'GC_EXPORT_POLL_MAX_DELAY', 30)
+        self.request_timeout = aiohttp.ClientTimeout(**getattr(
+            config, 'GC_REQUEST_TIMEOUT', {'sock_connect': 30, 'sock_read': 60, 'total': 300}
+        ))
         self.max_retries = getattr(config, 'GC_MAX_RETRIES', 3)
         self.retry_delay = getattr(config, 'GC_RETRY_DELAY', 5)
+        self.cache_ttl = getattr(config, 'GC_CACHE_TTL', 300)
         logger.debug("Configuration for GetCourse loaded")
 
     def _validate_config(self) -> None:
@@ -52,12 +64,19 @@ class GetCourseClient:
         """Reloads configuration from config.py."""
         importlib.reload(config)
         self._load_config()
+        self._email_cache.clear()
         logger.info("Configuration reloaded")
 
     async def start(self) -> None:
-        """Initializes ClientSession."""
+        """Initializes ClientSession with keep-alive connections and DNS cache."""
         if self.session is None:
-            self.session = aiohttp.ClientSession()
+            connector = aiohttp.TCPConnector(
+                limit=32,
+                keepalive_timeout=60,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
             logger.debug("ClientSession created")
 
     async def close(self) -> None:
@@ -67,48 +86,54 @@ class GetCourseClient:
             self.session = None
             logger.debug("ClientSession closed")
 
-    async def _get(self, endpoint: str, retry: int = 0) -> dict:
+    async def _get(self, endpoint: str) -> dict:
         """
         Performs a GET request to the GetCourse API with retries.
+
+        Responses with status 429 or 503, connection errors and timeouts are retried
+        up to GC_MAX_RETRIES times.
         
         Args:
             endpoint: Endpoint API.
-            retry: Current attempt (for recursion).
 
         Returns:
             API response in JSON format.
 
         Raises:
             aiohttp.ClientResponseError: In case of HTTP-request error after all retries.
+            aiohttp.ClientConnectionError: In case of connection error after all retries.
+            asyncio.TimeoutError: In case of timeout after all retries.
         """
         if self.session is None:
             await self.start()
 
         url = f"{self.base_url}{endpoint}"
-        logger.debug("GET request to %s", url)
+        retry = 0
+        while True:
+            logger.debug("GET request to %s", url)
+            try:
+                async with self.session.get(url, timeout=self.request_timeout) as response:
+                    response.raise_for_status()
+                    data = await response.json()
+                    logger.debug("Successful response from %s", url)
+                    return data
+            except aiohttp.ClientResponseError as e:
+                logger.warning("HTTP error %s on request %s: %s", e.status, url, e.message)
+                if retry >= self.max_retries or e.status not in (429, 503):
+                    raise
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                logger.warning("Connection error on request %s: %r", url, e)
+                if retry >= self.max_retries:
+                    raise
+            retry += 1
+            await asyncio.sleep(self.retry_delay)
 
-        try:
-            async with self.session.get(url) as response:
-                response.raise_for_status()
-                data = await response.json()
-                logger.debug("Successful response from %s", url)
-                return data
-        except aiohttp.ClientResponseError as e:
-            logger.warning("HTTP error %s on request %s: %s", e.status, url, e.message)
-            if retry < self.max_retries and e.status in (429, 503):
-                await asyncio.sleep(self.retry_delay)
-                return await self._get(endpoint, retry + 1)
-            raise
-        except Exception as e:
-            logger.error("Unknown error on request %s: %s", url, e)
-            raise
-
-    def _extract(self, path: str, data: dict) -> any:
+    def _extract(self, keys: Tuple[str, ...], data: dict) -> any:
         """
         Extracts data from a dictionary by a specified path.
         
         Args:
-            path: Path in the format of 'key1.key2.key3'.
+            keys: Path split into keys, e.g. ('key1', 'key2', 'key3').
             data: Dictionary with data.
 
         Returns:
@@ -118,29 +143,54 @@ class GetCourseClient:
             KeyError: If path does not exist.
         """
         try:
-            for key in path.split("."):
+            for key in keys:
                 data = data[key]
             return data
         except KeyError as e:
+            path = ".".join(keys)
             logger.error("Key %s not found in data at path %s", e, path)
             raise KeyError(f"Key {e} not found at path {path}") from e
 
     async def _get_export_data(self, export_id: str, wait_seconds: int) -> tuple[list, list]:
         """
-        Retrieves export data after waiting.
+        Retrieves export data, polling until the export is ready.
+
+        The delay between checks grows exponentially from 1 second up to
+        GC_EXPORT_POLL_MAX_DELAY.
         
         Args:
             export_id: Export ID.
-            wait_seconds: Wait time in seconds.
+            wait_seconds: Maximum wait time in seconds.
 
         Returns:
             Typle (fields, items) with fields and items of export.
+
+        Raises:
+            TimeoutError: If export is not ready within wait_seconds.
+            RuntimeError: If GetCourse returns any other error for the export.
         """
-        logger.info("Waiting %s seconds for export %s", wait_seconds, export_id)
-        await asyncio.sleep(wait_seconds)
-        data = await self._get(f"/exports/{export_id}?key={self.api_key}")
-        fields = self._extract(self.api_paths['fields'], data)
-        items = self._extract(self.api_paths['items'], data)
+        logger.info("Waiting up to %s seconds for export %s", wait_seconds, export_id)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait_seconds
+        delay = 1.0
+        while True:
+            data = await self._get(f"/exports/{export_id}?key={self.api_key}")
+            if data.get("success", True):
+                break
+            if data.get("error_code") != EXPORT_NOT_READY_CODE:
+                error_message = data.get("error_message", "unknown error")
+                logger.error("Export %s failed: %s", export_id, error_message)
+                raise RuntimeError(f"Export {export_id} failed: {error_message}")
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                logger.error("Export %s not ready after %s seconds", export_id, wait_seconds)
+                raise TimeoutError(f"Export {export_id} not ready after {wait_seconds} seconds")
+            logger.debug("Export %s not ready yet, next check in %.1f seconds", export_id, delay)
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 1.7, self.export_poll_max_delay)
+
+        fields = self._extract(self.api_paths_split['fields'], data)
+        items = self._extract(self.api_paths_split['items'], data)
         logger.debug("Received fields: %s, items: %s", len(fields), len(items))
         return fields, items
 
@@ -164,7 +214,7 @@ class GetCourseClient:
 
         logger.info("Requesting emails for group %s", group_id)
         data = await self._get(f"/groups/{group_id}/users?key={self.api_key}")
-        export_id = self._extract(self.api_paths['export_id'], data)
+        export_id = self._extract(self.api_paths_split['export_id'], data)
         fields, items = await self._get_export_data(export_id, self.wait_seconds['groups'])
 
         try:
@@ -173,13 +223,20 @@ class GetCourseClient:
             logger.warning("Field %s not found in fields", self.fields['email'])
             raise ValueError(f"Field '{self.fields['email']}' not found") from exc
 
-        emails = [row[email_index] for row in items if len(row) > email_index and row[email_index]]
+        # Short rows are skipped, empty emails are filtered out
+        emails = list(filter(None, map(
+            itemgetter(email_index), (row for row in items if len(row) > email_index)
+        )))
         logger.info("Found %s emails in group %s", len(emails), group_id)
         return emails
 
     async def get_user_group_ids_by_email(self, email: str) -> Optional[List[str]]:
         """
         Retrieves a list of group IDs for a user by their email.
+
+        Found groups are cached for GC_CACHE_TTL seconds, so repeated checks of the same
+        email do not request a new export. Empty results are not cached, so a user who
+        has just been enrolled is checked again right away.
         
         Args:
             email: User email.
@@ -194,10 +251,15 @@ class GetCourseClient:
             logger.error("Invalid email: %s", email)
             raise ValueError("email should be a valid string")
 
+        cached = self._email_cache.get(email)
+        if cached is not None and time.monotonic() - cached[0] < self.cache_ttl:
+            logger.info("Using cached groups for email %s: %s", email, cached[1])
+            return cached[1]
+
         logger.info("Requesting groups for email %s", email)
         encoded_email = quote(email)
         data = await self._get(f"/users?key={self.api_key}&email={encoded_email}&idgrouplist=id")
-        export_id = self._extract(self.api_paths['export_id'], data)
+        export_id = self._extract(self.api_paths_split['export_id'], data)
         fields, items = await self._get_export_data(export_id, self.wait_seconds['users'])
 
         try:
@@ -208,8 +270,17 @@ class GetCourseClient:
 
         if not items or len(items[0]) <= group_index:
             logger.info("Groups for email %s not found", email)
-            return None
+            group_ids = None
+        else:
+            group_ids = items[0][group_index] if items[0][group_index] else []
+            logger.info("Found groups for email %s: %s", email, group_ids)
 
-        group_ids = items[0][group_index] if items[0][group_index] else []
-        logger.info("Found groups for email %s: %s", email, group_ids)
+        if group_ids:
+            now = time.monotonic()
+            # Drop expired entries so the cache does not grow with every checked email
+            self._email_cache = {
+                key: value for key, value in self._email_cache.items()
+                if now - value[0] < self.cache_ttl
+            }
+            self._email_cache[email] = (now, group_ids)
         return group_ids
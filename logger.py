@@ -3,9 +3,14 @@ Module for configuring logging for the Telegram bot.
 
 Initializes the 'access-bot' logger with output to 'access-bot.log' file and console.
 Supports DEBUG (file) and INFO (console) logging levels with formatted output.
+Records are passed through a queue and written by a background thread,
+so logging calls do not block the event loop on disk I/O.
 """
 
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 
 # Create the logger
 logger = logging.getLogger("access-bot")  # Set the logger name
@@ -24,6 +29,9 @@ console_handler = logging.StreamHandler()
 console_handler.setLevel(logging.INFO)
 console_handler.setFormatter(formatter)
 
-# Add handlers
-logger.addHandler(file_handler)
-logger.addHandler(console_handler)
+# Add handlers through a queue processed in a background thread
+log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(log_queue))
+listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+listener.start()
+atexit.register(listener.stop)  # Flush remaining records on exit
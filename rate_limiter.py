@@ -0,0 +1,54 @@
+"""
+Module for limiting the rate of outgoing requests.
+Provides the AsyncTokenBucket class used to respect Telegram Bot API limits.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Optional
+
+class AsyncTokenBucket:
+    """Limiter allowing at most `rate` calls per `per` seconds."""
+
+    def __init__(self, rate: int, per: float = 1.0):
+        """
+        Initializes the limiter.
+
+        Args:
+            rate (int): Maximum number of calls per period.
+            per (float): Period length in seconds. Default is 1 second.
+        """
+        self.rate = rate
+        self.per = per
+        self._calls: Deque[float] = deque()
+        self._paused_until = 0.0
+        # Created on first use to bind it to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        """Waits until a call is allowed and registers it."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                while self._calls and now - self._calls[0] >= self.per:
+                    self._calls.popleft()
+                if len(self._calls) < self.rate:
+                    self._calls.append(now)
+                    return
+                await asyncio.sleep(self.per - (now - self._calls[0]))
+
+    def pause(self, seconds: float) -> None:
+        """
+        Blocks all calls for the specified time.
+
+        Args:
+            seconds (float): Pause duration in seconds.
+        """
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)